@@ -1,48 +1,150 @@
 import os
 import re
+import sys
+import json
+import signal
 import logging
-import requests
+import logging.handlers
+import queue
+import atexit
+import httpx
 import asyncio
 import mimetypes
 import tempfile
+import shutil
+import secrets
 import time
 from urllib.parse import urlparse, unquote
 from typing import Optional, Tuple, Dict
-from datetime import datetime
+from functools import cached_property
 import random
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
+import itertools
+import importlib.util
 from telegram import Update, InputFile
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
 
-# Configure logging
+try:
+    import fcntl  # POSIX only, used for the single-instance lock
+except ImportError:
+    fcntl = None
+
+try:
+    import uvloop  # Optional: faster event loop
+except ImportError:
+    uvloop = None
+
+try:
+    import orjson  # Optional: faster JSON parsing
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson else json.loads
+
+# Configure logging - records are queued and written by a background thread
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))  # log_handler adds the layout
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    handlers=[queue_handler],
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper()
 )
+# httpx logs every Bot API request (including each getUpdates) at INFO
+logging.getLogger('httpx').setLevel(logging.WARNING)
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Configuration - Get from Environment Variables (for Render.com)
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
 PORT = int(os.environ.get('PORT', 10000))  # Render.com provides PORT
+# Public base URL for webhook mode (Render.com provides RENDER_EXTERNAL_URL)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') or os.environ.get('RENDER_EXTERNAL_URL')
+WEBHOOK_PATH = f"/{BOT_TOKEN}"
+# Sent back by Telegram on every webhook call, random per run unless set
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+# Limits for the built-in web server
+HTTP_TIMEOUT = 5  # seconds to receive a request
+MAX_WEBHOOK_BODY = 1024 * 1024
+USER_AGENT = os.environ.get(
+    'USER_AGENT',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+# Number of updates processed concurrently (downloads are I/O bound)
+CONCURRENT_UPDATES = min(32, (os.cpu_count() or 1) * 4)
+# PTB's builder default; a custom request object would otherwise get a pool of 1
+CONNECTION_POOL_SIZE = 256
+# Multiplex Bot API calls over one connection when h2 is installed
+HTTP_VERSION = '2' if importlib.util.find_spec('h2') else '1.1'
+# Handlers only consume messages, so Telegram needn't send anything else
+ALLOWED_UPDATES = [Update.MESSAGE]
+# Plain text messages that are not commands (i.e. links to download)
+TEXT_ONLY = filters.TEXT & ~filters.COMMAND
+# Bytes read from the network and written to disk per iteration
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Seconds between sweeps of leftover temp files
+CLEANUP_INTERVAL = 600
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 50MB Telegram limit
-ALLOWED_EXTENSIONS = {
+ALLOWED_EXTENSIONS = frozenset({
     '.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm',
     '.mp3', '.wav', '.ogg', '.m4a', '.flac',
     '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt',
     '.zip', '.rar', '.7z', '.tar', '.gz',
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp',
     '.apk', '.exe', '.dmg', '.iso'
-}
+})
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+class FastJSONRequest(HTTPXRequest):
+    """HTTPXRequest that parses Bot API responses with orjson if available"""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> dict:
+        try:
+            return json_loads(payload)
+        except ValueError as e:
+            raise TelegramError("Invalid server response") from e
+
+# Compiled once at import instead of on every message
+URL_PATTERN = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP
+    r'(?::\d+)?'  # port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+
+# Pre-built HTTP responses for the web server
+HEALTH_RESPONSE = (b'HTTP/1.1 200 OK\r\n'
+                   b'Content-Type: text/plain\r\n'
+                   b'Content-Length: 13\r\n'
+                   b'Cache-Control: no-store\r\n'
+                   b'Connection: close\r\n\r\n'
+                   b'Bot is alive!')
+WEBHOOK_RESPONSE = b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+FORBIDDEN_RESPONSE = b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+BAD_REQUEST_RESPONSE = b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+TOO_LARGE_RESPONSE = b'HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
 
 class TelegramDownloadBot:
     def __init__(self):
+        self.start_time = time.monotonic()
         self.active_downloads = {}
         self.download_stats = {}
+        self.application = None
+        self.web_server = None
+        self.cleanup_task = None
+        self.download_ids = itertools.count()
+        # Non-blocking client, reuses connections between probe and download
+        self.http = httpx.AsyncClient(headers={'User-Agent': USER_AGENT}, follow_redirects=True)
         self.temp_dir = tempfile.mkdtemp(prefix="tg_downloads_")
-        logger.info(f"Created temp directory: {self.temp_dir}")
+        logger.info("Created temp directory: %s", self.temp_dir)
         
         # Ensure temp directory exists
         if not os.path.exists(self.temp_dir):
@@ -55,7 +157,7 @@ class TelegramDownloadBot:
         # Remove query strings and fragments
         filename = filename.split('?')[0].split('#')[0]
         # Remove invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+        filename = INVALID_FILENAME_CHARS.sub('', filename)
         # Replace spaces with underscores
         filename = filename.replace(' ', '_')
         # Limit length
@@ -81,35 +183,25 @@ class TelegramDownloadBot:
                 return filename
             
             # If no filename in URL, generate one
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
             if content_type:
                 ext = mimetypes.guess_extension(content_type) or '.bin'
                 return f"download_{timestamp}{ext}"
             return f"download_{timestamp}.bin"
             
         except Exception as e:
-            logger.error(f"Error extracting filename: {e}")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            logger.error("Error extracting filename: %s", e)
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
             return f"download_{timestamp}.bin"
     
     def is_valid_url(self, url: str) -> bool:
         """Validate URL format"""
-        pattern = re.compile(
-            r'^https?://'  # http:// or https://
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
-            r'localhost|'  # localhost
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP
-            r'(?::\d+)?'  # port
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        return bool(pattern.match(url))
+        return bool(URL_PATTERN.match(url))
     
-    def get_file_info(self, url: str) -> Tuple[Optional[int], Optional[str]]:
+    async def get_file_info(self, url: str) -> Tuple[Optional[int], Optional[str]]:
         """Get file size and type from URL headers"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+            response = await self.http.head(url, timeout=10)
             response.raise_for_status()
             
             size = int(response.headers.get('content-length', 0))
@@ -117,25 +209,24 @@ class TelegramDownloadBot:
             
             # If HEAD doesn't give size, try GET with range
             if size == 0:
-                response = requests.get(url, headers=headers, stream=True, timeout=5)
-                size = int(response.headers.get('content-length', 0))
-                content_type = response.headers.get('content-type', content_type)
+                async with self.http.stream('GET', url, timeout=5) as response:
+                    size = int(response.headers.get('content-length', 0))
+                    content_type = response.headers.get('content-type', content_type)
             
             return size, content_type
         except Exception as e:
-            logger.error(f"Error getting file info: {e}")
+            logger.error("Error getting file info: %s", e)
             return None, None
     
     def format_size(self, size_bytes: int) -> str:
         """Convert bytes to human readable format"""
         if size_bytes == 0:
             return "0B"
-        units = ['B', 'KB', 'MB', 'GB', 'TB']
         i = 0
-        while size_bytes >= 1024 and i < len(units) - 1:
+        while size_bytes >= 1024 and i < len(SIZE_UNITS) - 1:
             size_bytes /= 1024.0
             i += 1
-        return f"{size_bytes:.2f} {units[i]}"
+        return f"{size_bytes:.2f} {SIZE_UNITS[i]}"
     
     def is_extension_allowed(self, filename: str) -> bool:
         """Check if file extension is allowed"""
@@ -144,12 +235,10 @@ class TelegramDownloadBot:
     
     # ===== Bot Command Handlers =====
     
-    async def start_command(self, update: Update, context: CallbackContext):
-        """Handle /start command"""
-        user = update.effective_user
-        welcome_text = f"""
-🤖 Welcome {user.first_name}!
-
+    @cached_property
+    def welcome_text(self) -> str:
+        """Welcome message body, built once (the greeting is per user)"""
+        return f"""
 I'm your personal download assistant. I can download files from direct links and send them to you.
 
 How to use:
@@ -175,11 +264,16 @@ Commands:
 
 Just send me a link to get started!
         """
-        await update.message.reply_text(welcome_text)
     
-    async def help_command(self, update: Update, context: CallbackContext):
-        """Handle /help command"""
-        help_text = f"""
+    async def start_command(self, update: Update, context: CallbackContext):
+        """Handle /start command"""
+        user = update.effective_user
+        await update.message.reply_text(f"\n🤖 Welcome {user.first_name}!\n" + self.welcome_text)
+    
+    @cached_property
+    def help_text(self) -> str:
+        """Help message, built once since it never changes"""
+        return f"""
 📚 Help Guide
 
 What I can download:
@@ -206,50 +300,64 @@ Troubleshooting:
 Need help?
 Just send me a link and I'll try to download it!
         """
-        
-        await update.message.reply_text(help_text)
+    
+    async def help_command(self, update: Update, context: CallbackContext):
+        """Handle /help command"""
+        await update.message.reply_text(self.help_text)
 
-    async def status_command(self, update: Update, context: CallbackContext):
-        """Handle /status command"""
-        active_count = len(self.active_downloads)
-        bot_uptime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        status_text = f"""
-📊 Bot Status
-• Active downloads: {active_count}
-• Server time: {bot_uptime}
-• Max file size: {self.format_size(MAX_FILE_SIZE)}
+    @cached_property
+    def status_suffix(self) -> str:
+        """Constant tail of the status message, built once"""
+        return f"""• Max file size: {self.format_size(MAX_FILE_SIZE)}
 • Ready: ✅
 
 Storage:
 • Temp directory: {self.temp_dir}
 • Files will be automatically cleaned up
         """
+    
+    async def status_command(self, update: Update, context: CallbackContext):
+        """Handle /status command"""
+        uptime = time.monotonic() - self.start_time
+        # Concatenated, not str.format()ed: temp_dir may contain braces
+        status_text = (
+            f"\n📊 Bot Status\n"
+            f"• Active downloads: {len(self.active_downloads)}\n"
+            f"• Server time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"• Uptime: {int(uptime // 3600)}h {int(uptime % 3600 // 60)}m\n"
+            + self.status_suffix
+        )
         await update.message.reply_text(status_text)
     
     async def handle_url_message(self, update: Update, context: CallbackContext):
         """Handle URL messages"""
+        message = update.message
         user_id = update.effective_user.id
-        url = update.message.text.strip()
+        url = message.text.strip()
         
         # Check if already downloading
         if user_id in self.active_downloads:
-            await update.message.reply_text("⏳ You already have a download in progress. "
-                                          "Wait")
+            await message.reply_text("⏳ You already have a download in progress. "
+                                   "Wait")
             return
         
         # Validate URL
         if not self.is_valid_url(url):
-            await update.message.reply_text("❌ Invalid URL\n"
-                                          "Please send a valid HTTP/HTTPS link starting with http:// or https://")
+            await message.reply_text("❌ Invalid URL\n"
+                                   "Please send a valid HTTP/HTTPS link starting with http:// or https://")
             return
         
-        # Send initial status
-        status_msg = await update.message.reply_text("🔍 Analyzing URL...")
+        # Reserve the slot before awaiting, updates are handled concurrently
+        self.active_downloads[user_id] = url
+        status_msg = None
+        filepath = None
         
         try:
+            # Send initial status
+            status_msg = await message.reply_text("🔍 Analyzing URL...")
+            
             # Get file info
-            file_size, content_type = self.get_file_info(url)
+            file_size, content_type = await self.get_file_info(url)
             
             if file_size is None:
                 await status_msg.edit_text("❌ Cannot access file\n"
@@ -289,55 +397,49 @@ Storage:
             # Start download
             self.active_downloads[user_id] = filename
             
-            filepath = os.path.join(self.temp_dir, filename)
+            # Prefix with a per-download id so concurrent downloads of the
+            # same filename never share a path
+            filepath = os.path.join(self.temp_dir, f"{next(self.download_ids):x}_{filename}")
 
             # Download with progress
             success = await self.download_file(url, filepath, status_msg, user_id, filename)
             
             if not success:
-                if user_id in self.active_downloads:
-                    del self.active_downloads[user_id]
                 return
                 
             # Send file to user
             await self.send_file_to_user(update, filepath, filename, status_msg)
             
-            # Clean up
-            if user_id in self.active_downloads:
-                del self.active_downloads[user_id]
-            if os.path.exists(filepath):
+        except Exception as e:
+            logger.error("Error in handle_url_message: %s", e)
+            if status_msg:
+                await status_msg.edit_text(f"❌ Error\n"
+                                         f"\n{str(e)[:200]}\n\n"
+                                         f"\nPlease try again or use a different link.")
+        finally:
+            self.active_downloads.pop(user_id, None)
+            self.download_stats.pop(user_id, None)
+            # Clean up, including partial files from failed downloads
+            if filepath and os.path.exists(filepath):
                 os.remove(filepath)
+    
+    async def stream_to_file(self, url: str, filepath: str):
+        """Stream URL content to disk"""
+        async with self.http.stream('GET', url, timeout=30) as response:
+            response.raise_for_status()
             
-        except Exception as e:
-            logger.error(f"Error in handle_url_message: {e}")
-            await status_msg.edit_text(f"❌ Error\n"
-                                     f"\n{str(e)[:200]}\n\n"
-                                     f"\nPlease try again or use a different link.")
-            user_id = update.effective_user.id
-            if user_id in self.active_downloads:
-                filename = self.active_downloads[user_id]
-                del self.active_downloads[user_id]
+            with open(filepath, 'wb') as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
     
     async def download_file(self, url: str, filepath: str, status_msg, user_id: int, filename: str) -> bool:
         """Download file with measuring speed"""
         try:
-            start_time = time.time()
+            start_time = time.monotonic()
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            
-            # Download with measuring speed
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            await self.stream_to_file(url, filepath)
             
-            end_time = time.time()
+            end_time = time.monotonic()
             download_time = end_time - start_time
             
             # Calculate average speed
@@ -358,18 +460,19 @@ Storage:
             return True
             
         except Exception as e:
-            logger.error(f"Download error: {e}")
+            logger.error("Download error: %s", e)
             await status_msg.edit_text(f"❌ Download Failed\nError: {str(e)[:100]}")
             return False
     
     async def send_file_to_user(self, update: Update, filepath: str, filename: str, status_msg):
         """Send downloaded file to user with download stats"""
         try:
+            message = update.message
             user_id = update.effective_user.id
             file_size = os.path.getsize(filepath)
             
-            # Get download stats if available
-            stats = self.download_stats.get(user_id, {})
+            # Get download stats if available (removed as they are read)
+            stats = self.download_stats.pop(user_id, {})
             download_time = stats.get('download_time', 0)
             avg_speed = stats.get('avg_speed', 'N/A')
             
@@ -390,33 +493,29 @@ Storage:
                 f"Avg Speed: {avg_speed}\n"
                 f"\n📤 Uploading to Telegram..."
             )
-            
-            # Remove stats after showing
-            if user_id in self.download_stats:
-                del self.download_stats[user_id]
         
             # Determine file type and send appropriately
             mime_type, _ = mimetypes.guess_type(filepath)
             
             with open(filepath, 'rb') as file:
                 if mime_type and mime_type.startswith('video/'):
-                    await update.message.reply_video(
+                    await message.reply_video(
                         video=InputFile(file, filename=filename),
                         caption=f"🎬 {filename}",
                         supports_streaming=True
                     )
                 elif mime_type and mime_type.startswith('image/'):
-                    await update.message.reply_photo(
+                    await message.reply_photo(
                         photo=InputFile(file, filename=filename),
                         caption=f"🖼️ {filename}"
                     )
                 elif mime_type and mime_type.startswith('audio/'):
-                    await update.message.reply_audio(
+                    await message.reply_audio(
                         audio=InputFile(file, filename=filename),
                         caption=f"🎵 {filename}"
                     )
                 else:
-                    await update.message.reply_document(
+                    await message.reply_document(
                         document=InputFile(file, filename=filename),
                         caption=f"📁 {filename}"
                     )
@@ -424,11 +523,11 @@ Storage:
             await status_msg.delete()
             
         except Exception as e:
-            logger.error(f"Error sending file: {e}")
+            logger.error("Error sending file: %s", e)
             # Try to send as document if specific type fails
             try:
                 with open(filepath, 'rb') as file:
-                    await update.message.reply_document(
+                    await message.reply_document(
                         document=InputFile(file, filename=filename),
                         caption=f"📁 {filename}",
                     )
@@ -446,42 +545,194 @@ Storage:
                 try:
                     # Remove files older than 1 hour
                     if os.path.isfile(filepath):
-                        file_age = datetime.now().timestamp() - os.path.getmtime(filepath)
+                        file_age = time.time() - os.path.getmtime(filepath)
                         if file_age > 3600:  # 1 hour
                             os.remove(filepath)
-                            logger.info(f"Cleaned up old file: {filename}")
+                            logger.info("Cleaned up old file: %s", filename)
                 except Exception as e:
-                    logger.error(f"Error cleaning up {filename}: {e}")
+                    logger.error("Error cleaning up %s: %s", filename, e)
         except Exception as e:
-            logger.error(f"Error in cleanup: {e}")
+            logger.error("Error in cleanup: %s", e)
+    
+    async def cleanup_loop(self):
+        """Run cleanup_temp_files every CLEANUP_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            await self.cleanup_temp_files()
+    
+    async def startup(self, application: Application):
+        """Start the web server and background tasks on the bot's event loop"""
+        self.web_server = await asyncio.start_server(self.handle_http, '0.0.0.0', PORT, backlog=128)
+        logger.info("✅ Web server on port %s", PORT)
+        self.cleanup_task = asyncio.create_task(self.cleanup_loop())
+    
+    async def shutdown(self, application: Application):
+        """Release resources when the application shuts down"""
+        if self.cleanup_task:
+            self.cleanup_task.cancel()
+        if self.web_server:
+            self.web_server.close()
+            await self.web_server.wait_closed()
+        await self.http.aclose()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logger.info("Removed temp directory: %s", self.temp_dir)
     
     # ===== Bot Setup and Run =====
     
     def setup_handlers(self, application: Application):
         """Set up bot command handlers"""
-        # Command handlers
-        application.add_handler(CommandHandler("start", self.start_command))
-        application.add_handler(CommandHandler("help", self.help_command))
-        application.add_handler(CommandHandler("status", self.status_command))
-        
-        # URL handler
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND, 
-            self.handle_url_message
-        ))
+        application.add_handlers([
+            # Command handlers
+            CommandHandler("start", self.start_command),
+            CommandHandler("help", self.help_command),
+            CommandHandler("status", self.status_command),
+            # URL handler
+            MessageHandler(TEXT_ONLY, self.handle_url_message),
+        ])
         
         # Error handler
         async def error_handler(update: Update, context: CallbackContext):
-            logger.error(f"Update {update} caused error {context.error}")
+            if context.error is not None:
+                logger.error("Update %s caused error: %s", getattr(update, 'update_id', update),
+                             context.error, exc_info=context.error)
             
         application.add_error_handler(error_handler)
     
+    def build_application(self, updater: bool = True) -> Application:
+        """Build application with orjson parsing and HTTP/2 when available"""
+        builder = (Application.builder().token(BOT_TOKEN)
+                   .request(FastJSONRequest(connection_pool_size=CONNECTION_POOL_SIZE,
+                                            http_version=HTTP_VERSION))
+                   .concurrent_updates(CONCURRENT_UPDATES))
+        if updater:
+            builder = builder.get_updates_request(FastJSONRequest())
+        else:
+            builder = builder.updater(None)
+        application = builder.build()
+        self.setup_handlers(application)
+        return application
+    
+    def run_async(self, coro):
+        """Run a coroutine on a fresh event loop, uvloop when installed"""
+        if uvloop:
+            logger.info("Using uvloop event loop")
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+            return runner.run(coro)
+
     def run_polling(self):
         """Run bot with polling (for local testing)"""
-        application = Application.builder().token(BOT_TOKEN).build()
-        self.setup_handlers(application)
         logger.info("Starting bot in polling mode...")
-        application.run_polling()
+        self.run_async(self.serve(webhook=False))
+
+    def run_webhook(self):
+        """Run bot with webhook (for deployment)"""
+        logger.info("Starting bot in webhook mode on port %s...", PORT)
+        self.run_async(self.serve(webhook=True))
+
+    async def serve(self, webhook: bool):
+        """Serve health checks and bot updates on a single event loop"""
+        application = self.build_application(updater=not webhook)
+        if webhook:
+            self.application = application
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C still cancels asyncio.run
+
+        try:
+            # Bind PORT before connecting to Telegram so health checks pass
+            # while the bot starts, and webhook updates have a listener
+            await self.startup(application)
+            async with application:
+                await application.start()
+                try:
+                    if webhook:
+                        await application.bot.set_webhook(
+                            WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                            allowed_updates=ALLOWED_UPDATES,
+                            secret_token=WEBHOOK_SECRET
+                        )
+                    else:
+                        # Long polling: each getUpdates call blocks server-side for up to 30s
+                        await application.updater.start_polling(
+                            poll_interval=0.0,
+                            timeout=30,
+                            bootstrap_retries=-1,
+                            allowed_updates=ALLOWED_UPDATES
+                        )
+                    await stop_event.wait()
+                finally:
+                    if application.updater and application.updater.running:
+                        await application.updater.stop()
+                    await application.stop()
+        finally:
+            await self.shutdown(application)
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        """Read request line and headers, None if the client sent nothing"""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method, path, headers
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle a single HTTP request: webhook updates or health check"""
+        body = None
+        try:
+            try:
+                request = await asyncio.wait_for(self.read_request(reader), HTTP_TIMEOUT)
+                if request is None:
+                    return  # Port probe or empty connection
+                method, path, headers = request
+
+                if method == 'POST' and path == WEBHOOK_PATH and self.application:
+                    if headers.get('x-telegram-bot-api-secret-token') != WEBHOOK_SECRET:
+                        response = FORBIDDEN_RESPONSE
+                    else:
+                        content_length = int(headers.get('content-length', 0))
+                        if not 0 <= content_length <= MAX_WEBHOOK_BODY:
+                            response = TOO_LARGE_RESPONSE
+                        else:
+                            body = await asyncio.wait_for(reader.readexactly(content_length), HTTP_TIMEOUT)
+                            response = WEBHOOK_RESPONSE
+                else:
+                    response = HEALTH_RESPONSE
+            except ValueError:
+                # Malformed request line, overlong header line or bad Content-Length
+                response = BAD_REQUEST_RESPONSE
+
+            writer.write(response)
+            await asyncio.wait_for(writer.drain(), HTTP_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return  # Client stalled or went away
+        except Exception as e:
+            logger.error("Error handling HTTP request: %s", e)
+            return
+        finally:
+            writer.close()
+
+        if body is not None:
+            # Telegram already has its 200, parse once it stops waiting.
+            # A failure here loses the update, Telegram will not resend it
+            try:
+                update = Update.de_json(json_loads(body), self.application.bot)
+            except Exception:
+                logger.exception("Dropped webhook update: could not parse %d byte body", len(body))
+                return
+            await self.application.update_queue.put(update)
 
 # ===== Main Execution =====
 
@@ -509,33 +760,26 @@ def main():
 • Max file size: {MAX_FILE_SIZE / (1024*1024):.0f}MB
 • Temp directory: {tempfile.gettempdir()}
 • Port: {PORT}
+• Mode: {'webhook' if WEBHOOK_URL else 'polling'}
     
 Starting bot...
     """)
-    # Create health server
-    class HealthHandler(BaseHTTPRequestHandler):
-        def do_GET(self):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'Bot is alive!')
-
-        def log_message(self, format, *args):
-            pass  # Silence logs
-
-    def run_health_server():
-        port = PORT
-        httpd = HTTPServer(('0.0.0.0', port), HealthHandler)
-        logger.info(f"✅ Health server on port {port}")
-        httpd.serve_forever()
-
-    # Start health server
-    health_thread = threading.Thread(target=run_health_server, daemon=True)
-    health_thread.start()
-    
+    # Only one instance per token may talk to Telegram, the rest would get 409 Conflict
+    lock_name = f"tg_download_bot_{BOT_TOKEN.split(':')[0]}.lock"
+    lock_file = open(os.path.join(tempfile.gettempdir(), lock_name), 'w')
+    if fcntl:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("❌ ERROR: Another bot instance is already running on this host!")
+            sys.exit(1)
+
     # Create and run bot
     bot = TelegramDownloadBot()
-    bot.run_polling()
+    if WEBHOOK_URL:
+        bot.run_webhook()
+    else:
+        bot.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file